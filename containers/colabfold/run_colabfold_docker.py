@@ -8,9 +8,44 @@ This script accepts command line arguments and runs ColabFold through Docker.
 import subprocess
 import sys
 import argparse
+import fcntl
+import hashlib
+import shutil
+import tempfile
+import time
+from collections import deque
 from pathlib import Path
 import os
 
+# Static leading arguments of the docker command
+_CF_PREFIX = ("docker", "run", "--rm")
+
+# A successful Docker check is trusted for this many seconds
+PREFLIGHT_TTL = 60
+
+# Inputs with these suffixes are checked before any container is started.
+# Residues accepted in them: the 20 standard amino acids, the ambiguity codes
+# X/B/Z/U/O, and ':' which separates the chains of a complex.
+FASTA_SUFFIXES = {'.fasta', '.fa', '.faa'}
+_AA = frozenset('ACDEFGHIKLMNPQRSTVWYXBZUO:')
+
+# MSAs are cached by the SHA-256 of their sequence so repeated chains are only
+# searched once, across batches and across runs
+MSA_CACHE_DIR = Path(__file__).parent.absolute() / "msa_cache"
+
+# Number of trailing log lines kept for the error report
+LOG_TAIL_LINES = 500
+
+# XLA memory fraction: above 1.0 lets JAX spill into host RAM through unified
+# memory; without unified memory fall back to JAX's own default.
+UNIFIED_MEM_FRACTION = '4.0'
+DEVICE_MEM_FRACTION = '0.75'
+
+# Inputs at or above this many residues run with unified memory disabled: short
+# sequences speed up a lot with host-RAM overflow, but very long ones (~1.8k aa)
+# have been seen to OOM with it enabled and only succeed without it.
+UNIFIED_MEMORY_MAX_LEN = 1500
+
 def print_msg(color: str, msg: str):
     """Print colored message to terminal."""
     print(f"\033[{color}m{msg}\033[0m")
@@ -27,19 +62,214 @@ def parse_args():
     parser.add_argument('--max-msa', default='auto', help='Maximum MSA sequences in format max_seq:max_extra_seq (default: auto)')
     parser.add_argument('--output-dir', default='output', help='Output directory (default: output)')
     parser.add_argument('--use-gpu', action='store_true', default=True, help='Use GPU if available')
+    parser.add_argument('--mem-fraction', help=f'XLA_PYTHON_CLIENT_MEM_FRACTION for the GPU (default: {UNIFIED_MEM_FRACTION}, or {DEVICE_MEM_FRACTION} without unified memory)')
+    parser.add_argument('--disable-unified-memory', action='store_true', default=False, help='Keep JAX allocations on the GPU instead of overflowing into host RAM')
+    parser.add_argument('--msa-cache', action='store_true', default=False, help='Reuse MSAs from msa_cache/ and predict each unique sequence only once')
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    try:
+        args.max_msa_resolved = resolve_max_msa(args.max_seq, args.max_extra_seq, args.max_msa)
+    except ValueError:
+        parser.error(f"invalid --max-msa value: {args.max_msa}")
+    return args
+
+def resolve_max_msa(max_seq=None, max_extra_seq=None, max_msa='auto'):
+    """Return the ColabFold --max-msa value ("max_seq:max_extra_seq"), or None for auto."""
+    if max_seq is not None and max_extra_seq is not None:
+        # Both parameters provided, use them together
+        return f"{max_seq}:{max_extra_seq}"
+    if max_seq is not None:
+        # Only max_seq provided, use default ratio
+        return f"{max_seq}:{max_seq * 2}"
+    if max_extra_seq is not None:
+        # Only max_extra_seq provided, use default ratio
+        return f"{max_extra_seq // 2}:{max_extra_seq}"
+    if max_msa != 'auto':
+        # Legacy max-msa parameter; a single number n becomes "n:2n"
+        max_msa = str(max_msa)
+        if ':' not in max_msa:
+            max_seq = int(max_msa)
+            return f"{max_seq}:{max_seq * 2}"
+        return max_msa
+    return None
 
 def check_docker():
-    """Check if Docker is available."""
+    """Check if Docker is available, reusing a recent successful check."""
+    marker = Path(tempfile.gettempdir()) / f".colabfold_preflight.{os.getuid()}"
+    try:
+        if time.time() - marker.stat().st_mtime < PREFLIGHT_TTL:
+            return True
+    except OSError:
+        pass
+
     try:
         subprocess.run(['docker', '--version'], capture_output=True, check=True)
+        marker.touch()
         return True
     except (subprocess.CalledProcessError, FileNotFoundError):
         print_msg("31", "Error: Docker is not available")
         return False
 
-def run_colabfold_docker(input_file, output_dir, model_type, num_models, num_recycles, max_seq=None, max_extra_seq=None, max_msa='auto', use_gpu=True):
+def _read_fasta(path):
+    """Check a FASTA file in one pass and return its (header, sequence) pairs.
+
+    Raises ValueError for an empty file, sequence data before the first header,
+    duplicate record ids, headers that map to the same output file name, empty
+    records, or non amino-acid characters.
+    """
+    records = []
+    seen = set()
+    filenames = {}
+    header = None
+    chunks = []
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('>'):
+                if header is not None:
+                    if not chunks:
+                        raise ValueError(f"record '{header.split()[0]}' has no sequence")
+                    records.append((header, ''.join(chunks)))
+                header = line[1:].strip()
+                if not header:
+                    raise ValueError(f"line {lineno}: empty header")
+                record_id = header.split()[0]
+                if record_id in seen:
+                    raise ValueError(f"duplicate record id '{record_id}'")
+                seen.add(record_id)
+                # ColabFold names its files after the sanitised header
+                filename = _safe_filename(header)
+                if filename in filenames:
+                    raise ValueError(f"headers '{filenames[filename]}' and '{header}' both map to file name '{filename}'")
+                filenames[filename] = header
+                chunks = []
+            elif header is None:
+                raise ValueError(f"line {lineno}: sequence data before the first '>' header")
+            else:
+                bad = set(line.upper()) - _AA
+                if bad:
+                    raise ValueError(f"line {lineno}: invalid residue(s) {''.join(sorted(bad))} in record '{header.split()[0]}'")
+                chunks.append(line)
+    if header is None:
+        raise ValueError("no FASTA records found")
+    if not chunks:
+        raise ValueError(f"record '{header.split()[0]}' has no sequence")
+    records.append((header, ''.join(chunks)))
+    return records
+
+def _safe_filename(name):
+    """Sanitise a FASTA header the same way ColabFold names its job files."""
+    return ''.join(c if c.isalnum() or c in '_.-' else '_' for c in name)
+
+def _stream(cmd):
+    """Run cmd, forwarding its output line by line; return (returncode, log tail)."""
+    # Stream the log through instead of buffering all of it in memory; only the
+    # tail is kept for the error report.
+    tail = deque(maxlen=LOG_TAIL_LINES)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    for line in proc.stdout:
+        print(line, end='', flush=True)
+        tail.append(line)
+    return proc.wait(), tail
+
+def prepare_msa_cache(records, docker_cmd, stage_dir, script_dir):
+    """Stage one cached MSA per unique sequence, computing the missing ones first.
+
+    Sequences without a cached MSA are run once through ``colabfold_batch
+    --msa-only`` and their MSAs moved into MSA_CACHE_DIR under a lock, so
+    concurrent runs can share the cache. Returns ``(query_dir, groups)`` where
+    query_dir holds ``<name>.a3m`` links for the structure run and groups maps
+    each predicted name to the record names that share its sequence;
+    query_dir is None if the MSA run failed.
+    """
+    MSA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Keep the first record of every distinct sequence
+    unique = {}
+    groups = {}
+    for header, seq in records:
+        digest = hashlib.sha256(seq.upper().encode()).hexdigest()
+        name = _safe_filename(header)
+        if digest in unique:
+            groups[unique[digest][0]].append(name)
+        else:
+            unique[digest] = (name, seq)
+            groups[name] = []
+
+    missing = [digest for digest in unique if not (MSA_CACHE_DIR / f"{digest}.a3m").exists()]
+    print_msg("34", f"MSA cache: {len(records)} record(s), {len(unique)} unique, {len(missing)} to compute")
+
+    if missing:
+        todo_fasta = stage_dir / "msa_todo.fasta"
+        msa_out = stage_dir / "msa_out"
+        msa_out.mkdir(parents=True, exist_ok=True)
+        with open(todo_fasta, 'w') as f:
+            for digest in missing:
+                # Naming the record by its digest makes ColabFold write <digest>.a3m
+                f.write(f">{digest}\n{unique[digest][1]}\n")
+
+        msa_cmd = docker_cmd + [
+            f"/data/{todo_fasta.relative_to(script_dir)}",
+            f"/data/{msa_out.relative_to(script_dir)}",
+            "--msa-only"
+        ]
+        print_msg("36", f"Running: {' '.join(msa_cmd)}")
+        returncode, tail = _stream(msa_cmd)
+        if returncode != 0:
+            print_msg("31", f"✗ MSA generation failed with return code {returncode}")
+            print_msg("31", f"Last {len(tail)} log lines:\n{''.join(tail)}")
+            return None, groups
+
+        absent = [digest for digest in missing if not (msa_out / f"{digest}.a3m").exists()]
+        if absent:
+            print_msg("31", f"✗ MSA generation did not produce {len(absent)} expected MSA file(s), e.g. {absent[0]}.a3m")
+            return None, groups
+
+        with open(MSA_CACHE_DIR / ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for digest in missing:
+                cached = MSA_CACHE_DIR / f"{digest}.a3m"
+                if not cached.exists():
+                    os.replace(msa_out / f"{digest}.a3m", cached)
+
+    # Relative links so they also resolve inside the container's /data mount
+    query_dir = stage_dir / "queries"
+    query_dir.mkdir(parents=True, exist_ok=True)
+    for digest, (name, _) in unique.items():
+        link = query_dir / f"{name}.a3m"
+        link.symlink_to(os.path.relpath(MSA_CACHE_DIR / f"{digest}.a3m", query_dir))
+
+    return query_dir, groups
+
+def link_duplicate_results(output_path, groups):
+    """Expose the results of each predicted sequence under its duplicate record names."""
+    # Longest name first so "a_b_..." is not claimed by "a"
+    names = sorted(groups, key=len, reverse=True)
+    for entry in os.scandir(output_path):
+        owner = next((n for n in names if entry.name.startswith((n + '_', n + '.'))), None)
+        if owner is None:
+            continue
+        for duplicate in groups[owner]:
+            link = output_path / (duplicate + entry.name[len(owner):])
+            if not os.path.lexists(link):
+                link.symlink_to(entry.name)
+
+def count_pdbs(root, sample=3):
+    """Count .pdb files under root, keeping the names of the first few."""
+    count = 0
+    names = []
+    for _, _, files in os.walk(root):
+        for name in files:
+            if name.endswith('.pdb'):
+                count += 1
+                if len(names) < sample:
+                    names.append(name)
+    return count, names
+
+def run_colabfold_docker(input_file, output_dir, model_type, num_models, num_recycles, max_msa=None, use_gpu=True,
+                         mem_fraction=None, disable_unified_memory=False, msa_cache=False):
     """Run ColabFold using Docker container."""
     
     script_dir = Path(__file__).parent.absolute()
@@ -50,53 +280,85 @@ def run_colabfold_docker(input_file, output_dir, model_type, num_models, num_rec
     if not input_path.exists():
         print_msg("31", f"Input file does not exist: {input_path}")
         return 1
+
+    # Reject malformed FASTA before paying for container start-up and JAX compilation;
+    # the parsed records are reused below
+    records = None
+    if input_path.suffix.lower() in FASTA_SUFFIXES:
+        try:
+            records = _read_fasta(input_path)
+        except (ValueError, UnicodeDecodeError) as e:
+            print_msg("31", f"Invalid FASTA input {input_path.name}: {e}")
+            return 1
+        print_msg("34", f"Validated {len(records)} FASTA record(s)")
     
     # Create output directory
     output_path.mkdir(parents=True, exist_ok=True)
+
+    # Pick the allocator path by sequence length unless the caller chose already
+    if use_gpu and not disable_unified_memory and records:
+        # Complexes separate chains with ':'; count residues only
+        max_len = max(len(seq) - seq.count(':') for _, seq in records)
+        if max_len >= UNIFIED_MEMORY_MAX_LEN:
+            print_msg("33", f"Longest sequence has {max_len} residues (>= {UNIFIED_MEMORY_MAX_LEN}), disabling unified memory")
+            disable_unified_memory = True
     
     # Docker paths (inside container)
     docker_input = f"/data/{input_path.relative_to(script_dir)}"
     docker_output = f"/data/{output_path.relative_to(script_dir)}"
     
     # Build ColabFold command
-    cmd = [
-        "docker", "run", "--rm"
-    ]
+    docker_cmd = list(_CF_PREFIX)
     
     # Add GPU support if requested and available
     if use_gpu:
-        cmd.extend(["--gpus", "all"])
+        docker_cmd.extend(["--gpus", "all"])
+
+        # GPU memory settings. Unified memory lets long sequences overflow into host
+        # RAM instead of failing with RESOURCE_EXHAUSTED; the image enables it by
+        # default, so disabling it has to be passed explicitly.
+        if mem_fraction is None:
+            mem_fraction = DEVICE_MEM_FRACTION if disable_unified_memory else UNIFIED_MEM_FRACTION
+        docker_cmd.extend([
+            "-e", f"TF_FORCE_UNIFIED_MEMORY={0 if disable_unified_memory else 1}",
+            "-e", f"XLA_PYTHON_CLIENT_MEM_FRACTION={mem_fraction}",
+            "-e", "TF_FORCE_GPU_ALLOW_GROWTH=true",
+            "-e", "XLA_PYTHON_CLIENT_ALLOCATOR=platform"
+        ])
     
-    cmd.extend([
+    docker_cmd.extend([
         "-v", f"{script_dir}:/data",
         "colabfold",
-        "colabfold_batch",
+        "colabfold_batch"
+    ])
+
+    # Deduplicate sequences and reuse cached MSAs before predicting structures
+    stage_dir = output_path / "msa_stage"
+    groups = {}
+    if msa_cache and records is None:
+        print_msg("33", "--msa-cache needs FASTA input, running without the MSA cache")
+    elif msa_cache:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True)
+        query_dir, groups = prepare_msa_cache(records, docker_cmd, stage_dir, script_dir)
+        if query_dir is None:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            return 1
+        docker_input = f"/data/{query_dir.relative_to(script_dir)}"
+
+    cmd = docker_cmd + [
         docker_input,
         docker_output,
         "--model-type", model_type,
         "--num-models", str(num_models),
         "--num-recycle", str(num_recycles)
-    ])
+    ]
+
+    if use_gpu and disable_unified_memory:
+        cmd.append("--disable-unified-memory")
     
-    # Handle max-seq and max-extra-seq parameters
-    if max_seq is not None and max_extra_seq is not None:
-        # Both parameters provided, use them together
-        cmd.extend(["--max-msa", f"{max_seq}:{max_extra_seq}"])
-    elif max_seq is not None:
-        # Only max_seq provided, use default ratio
-        cmd.extend(["--max-msa", f"{max_seq}:{max_seq * 2}"])
-    elif max_extra_seq is not None:
-        # Only max_extra_seq provided, use default ratio
-        max_seq_val = max_extra_seq // 2
-        cmd.extend(["--max-msa", f"{max_seq_val}:{max_extra_seq}"])
-    elif max_msa != 'auto':
-        # Legacy max-msa parameter provided
-        max_msa_value = str(max_msa)
-        if ':' not in max_msa_value:
-            # If it's a single number, convert to format "number:number*2"
-            max_seq_val = int(max_msa_value)
-            max_msa_value = f"{max_seq_val}:{max_seq_val * 2}"
-        cmd.extend(["--max-msa", max_msa_value])
+    if max_msa:
+        cmd.extend(["--max-msa", max_msa])
     
     print_msg("36", f"Running: {' '.join(cmd)}")
     print_msg("34", f"Input: {input_path.name}")
@@ -105,26 +367,30 @@ def run_colabfold_docker(input_file, output_dir, model_type, num_models, num_rec
     print_msg("34", f"GPU: {'Yes' if use_gpu else 'No'}")
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, tail = _stream(cmd)
+        shutil.rmtree(stage_dir, ignore_errors=True)
         
-        if result.returncode == 0:
+        if returncode == 0:
+            if any(groups.values()):
+                link_duplicate_results(output_path, groups)
+
             print_msg("32", f"✓ ColabFold completed successfully")
             print_msg("32", f"✓ Results saved to: {output_path}")
             
             # List output files
-            output_files = list(output_path.rglob("*.pdb"))
-            if output_files:
-                print_msg("32", f"✓ Generated {len(output_files)} structure files")
-                for f in output_files[:3]:  # Show first 3
-                    print_msg("37", f"  - {f.name}")
-                if len(output_files) > 3:
-                    print_msg("37", f"  ... and {len(output_files) - 3} more")
+            num_pdbs, sample_names = count_pdbs(output_path)
+            if num_pdbs:
+                print_msg("32", f"✓ Generated {num_pdbs} structure files")
+                for name in sample_names:  # Show first 3
+                    print_msg("37", f"  - {name}")
+                if num_pdbs > 3:
+                    print_msg("37", f"  ... and {num_pdbs - 3} more")
             
             return 0
         else:
-            print_msg("31", f"✗ ColabFold failed with return code {result.returncode}")
-            print_msg("31", f"STDERR: {result.stderr}")
-            return result.returncode
+            print_msg("31", f"✗ ColabFold failed with return code {returncode}")
+            print_msg("31", f"Last {len(tail)} log lines:\n{''.join(tail)}")
+            return returncode
             
     except Exception as e:
         print_msg("31", f"✗ Docker execution failed: {e}")
@@ -148,10 +414,11 @@ def main():
         args.model_type,
         args.num_models,
         args.num_recycles,
-        args.max_seq,
-        args.max_extra_seq,
-        args.max_msa,
-        args.use_gpu
+        args.max_msa_resolved,
+        args.use_gpu,
+        args.mem_fraction,
+        args.disable_unified_memory,
+        args.msa_cache
     )
 
 if __name__ == "__main__":
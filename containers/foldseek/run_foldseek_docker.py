@@ -26,6 +26,11 @@ Options:
     --coverage FLOAT        Coverage threshold (default: 0.0)
     --min-seq-id FLOAT      Minimum sequence identity (default: 0.0)
     --alignment-mode INT    Alignment mode (default: 3)
+    --db-load-mode INT      Database load mode (default: 3, mmap + touch)
+    --parallel INT          Number of concurrent batched searches (default: 1)
+    --shm-db                Copy the database into /dev/shm of the Foldseek container (if it fits in RAM)
+    --keep-tmp              Keep Foldseek's intermediate files in the tmp directory
+    -v, --verbose           Print the full docker command of every search
 
 Examples:
     # Process all PDB files with default parameters
@@ -39,8 +44,19 @@ Examples:
 
 All arguments have sensible defaults matching the repository layout.
 """
+import argparse
+import atexit
+import functools
+import shlex
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import os
 
@@ -53,201 +69,402 @@ DEFAULT_DB = SCRIPT_DIR / "database" / "influenza" / "fsInfluenzaDB"
 DEFAULT_TMP = SCRIPT_DIR / "tmp"
 DEFAULT_FORMAT = "query,target,alntmscore,evalue,pident,bits"
 
+# Host prefix of everything mounted at /data inside the container
+_DATA_PREFIX = str(SCRIPT_DIR) + os.sep
+
+# Static leading arguments for the two ways a search is launched
+_FS_RUN_PREFIX = ("docker", "run", "--rm")
+_FS_EXEC_PREFIX = ("docker", "exec")
+
+# Trailing stderr lines kept from each search for the failure report
+STDERR_TAIL_LINES = 100
+
+# Searches currently running, so an interrupt can stop them (they run in their
+# own session and do not receive the terminal's SIGINT)
+_RUNNING = set()
+_RUNNING_LOCK = threading.Lock()
+
+# A successful Docker/image check is trusted for this many seconds
+PREFLIGHT_TTL = 60
+
 
 def print_msg(color: str, msg: str):
     """Print colored message to terminal."""
     print(f"\033[{color}m{msg}\033[0m")
 
 
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser (see the module docstring for the options)."""
+    parser = argparse.ArgumentParser(description="Run Foldseek easy-search on PDB structures using Docker")
+    parser.add_argument("query_file", nargs="?", help="Specific PDB file to process (processes all if omitted)")
+    parser.add_argument("--input", dest="input_dir", type=Path, default=DEFAULT_INPUT_DIR, help="Input directory")
+    parser.add_argument("--output", dest="output_dir", type=Path, default=DEFAULT_OUTPUT_DIR, help="Output directory")
+    parser.add_argument("--db", dest="db_path", type=Path, default=DEFAULT_DB, help="Database path")
+    parser.add_argument("--tmp", dest="tmp_dir", type=Path, default=DEFAULT_TMP, help="Temporary directory")
+    parser.add_argument("--format", dest="fmt", default=DEFAULT_FORMAT, help="Output format")
+    parser.add_argument("--job-id", help="Job ID for job-specific directories and completion markers")
+
+    # Foldseek parameters
+    parser.add_argument("--sensitivity", type=float, default=9.5, help="Search sensitivity")
+    parser.add_argument("--evalue", type=float, default=10.0, help="E-value threshold")
+    parser.add_argument("--max-seqs", type=int, default=1000, help="Maximum sequences per query")
+    parser.add_argument("--threads", type=int, default=8, help="Number of threads")
+    parser.add_argument("--tmscore-threshold", type=float, default=0.0, help="TM-score threshold")
+    parser.add_argument("--coverage", type=float, default=0.0, help="Coverage threshold")
+    parser.add_argument("--min-seq-id", type=float, default=0.0, help="Minimum sequence identity")
+    parser.add_argument("--alignment-mode", type=int, default=3, help="Alignment mode")
+    parser.add_argument("--db-load-mode", type=int, default=3, help="Database load mode (3 = mmap + touch)")
+
+    # Execution
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="Number of concurrent batched searches; the query set is split evenly between them")
+    parser.add_argument("--shm-db", action="store_true",
+                        help="Copy the database into /dev/shm of the Foldseek container (if it fits in RAM)")
+    parser.add_argument("--keep-tmp", action="store_true", help="Keep Foldseek's intermediate files in the tmp directory")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the full docker command of every search")
+    return parser
+
+
+_PARSER = _build_parser()
+
+
 def parse_args():
     """Parse command line arguments."""
-    input_dir = DEFAULT_INPUT_DIR
-    output_dir = DEFAULT_OUTPUT_DIR
-    db_path = DEFAULT_DB
-    tmp_dir = DEFAULT_TMP
-    fmt = DEFAULT_FORMAT
-    
-    # Job management
-    job_id = None
-    
-    # Foldseek parameters
-    sensitivity = 9.5
-    evalue = 10.0
-    max_seqs = 1000
-    threads = 8
-    tmscore_threshold = 0.0
-    coverage = 0.0
-    min_seq_id = 0.0
-    alignment_mode = 3
-    query_file = None
-
-    args = sys.argv[1:]
-    i = 0
-    while i < len(args):
-        if args[i] == "--input" and i + 1 < len(args):
-            input_dir = Path(args[i + 1])
-            i += 2
-        elif args[i] == "--output" and i + 1 < len(args):
-            output_dir = Path(args[i + 1])
-            i += 2
-        elif args[i] == "--db" and i + 1 < len(args):
-            db_path = Path(args[i + 1])
-            i += 2
-        elif args[i] == "--tmp" and i + 1 < len(args):
-            tmp_dir = Path(args[i + 1])
-            i += 2
-        elif args[i] == "--format" and i + 1 < len(args):
-            fmt = args[i + 1]
-            i += 2
-        elif args[i] == "--sensitivity" and i + 1 < len(args):
-            try:
-                sensitivity = float(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid sensitivity value: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--evalue" and i + 1 < len(args):
-            try:
-                evalue = float(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid evalue: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--max-seqs" and i + 1 < len(args):
-            try:
-                max_seqs = int(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid max-seqs: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--threads" and i + 1 < len(args):
-            try:
-                threads = int(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid threads: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--tmscore-threshold" and i + 1 < len(args):
-            try:
-                tmscore_threshold = float(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid tmscore-threshold: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--coverage" and i + 1 < len(args):
-            try:
-                coverage = float(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid coverage: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--min-seq-id" and i + 1 < len(args):
-            try:
-                min_seq_id = float(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid min-seq-id: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--alignment-mode" and i + 1 < len(args):
-            try:
-                alignment_mode = int(args[i + 1])
-            except ValueError:
-                print_msg("31", f"Invalid alignment-mode: {args[i + 1]}")
-                sys.exit(1)
-            i += 2
-        elif args[i] == "--job-id" and i + 1 < len(args):
-            job_id = args[i + 1]
-            i += 2
-        elif args[i].startswith("--"):
-            print_msg("31", f"Unknown option: {args[i]}")
-            sys.exit(1)
-        else:
-            # This should be the query file
-            if query_file is None:
-                query_file = args[i]
-                i += 1
-            else:
-                print_msg("31", f"Multiple query files specified: {query_file}, {args[i]}")
-                sys.exit(1)
-    
+    args = _PARSER.parse_args()
+
     params = {
-        'sensitivity': sensitivity,
-        'evalue': evalue,
-        'max_seqs': max_seqs,
-        'threads': threads,
-        'tmscore_threshold': tmscore_threshold,
-        'coverage': coverage,
-        'min_seq_id': min_seq_id,
-        'alignment_mode': alignment_mode
+        'sensitivity': args.sensitivity,
+        'evalue': args.evalue,
+        'max_seqs': args.max_seqs,
+        'threads': args.threads,
+        'tmscore_threshold': args.tmscore_threshold,
+        'coverage': args.coverage,
+        'min_seq_id': args.min_seq_id,
+        'alignment_mode': args.alignment_mode,
+        'db_load_mode': args.db_load_mode,
+        'remove_tmp_files': 0 if args.keep_tmp else 1
     }
-    
-    return input_dir, output_dir, db_path, tmp_dir, fmt, params, query_file, job_id
 
+    return (args.input_dir, args.output_dir, args.db_path, args.tmp_dir, args.fmt, params,
+            args.query_file, args.job_id, args.parallel, args.shm_db, args.verbose)
 
-def run_foldseek_docker(query_pdb: Path, db_path: Path, out_tsv: Path, tmp_dir: Path, fmt: str, params: dict) -> int:
-    """Run Foldseek using Docker container with mounted volumes."""
-    
-    # Create absolute paths for mounting
-    script_dir_abs = SCRIPT_DIR.resolve()
-    
-    # Ensure all paths are absolute and resolve them relative to script directory if needed
-    if not query_pdb.is_absolute():
-        query_pdb = script_dir_abs / query_pdb
+
+def preflight() -> bool:
+    """Check that Docker and the foldseek image are available.
+
+    Success is recorded in a per-user marker file and reused for PREFLIGHT_TTL
+    seconds, so back-to-back runs skip the docker calls.
+    """
+    marker = Path(tempfile.gettempdir()) / f".foldseek_preflight.{os.getuid()}"
+    try:
+        if time.time() - marker.stat().st_mtime < PREFLIGHT_TTL:
+            return True
+    except OSError:
+        pass
+
+    # "docker images" fails when Docker is missing or not running, and prints
+    # nothing when the image has not been built
+    try:
+        result = subprocess.run(["docker", "images", "-q", "foldseek"], capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print_msg("31", "Docker is not available or not running")
+        return False
+    if not result.stdout.strip():
+        print_msg("31", "Foldseek Docker image not found. Please build it first with: docker build -t foldseek .")
+        return False
+
+    marker.touch()
+    return True
+
+
+def _db_size(db_path: Path) -> int:
+    """Total size in bytes of the DB and its sidecar files (db_path*)."""
+    return sum(f.stat().st_size for f in db_path.parent.glob(f"{db_path.name}*") if f.is_file())
+
+
+def _shm_fits(db_path: Path) -> bool:
+    """Whether a /dev/shm copy of the DB fits in currently available RAM."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+            else:
+                return False
+    except (OSError, ValueError):
+        return False
+    return _db_size(db_path) < available
+
+
+def _docker_path(path) -> str:
+    """Map a host path under SCRIPT_DIR (absolute, or relative to it) to its /data path."""
+    path = str(path)
+    if not os.path.isabs(path):
+        return "/data/" + path
+    if not path.startswith(_DATA_PREFIX):
+        raise ValueError(f"{path} is not under {SCRIPT_DIR} and cannot be mounted into the container")
+    return "/data/" + path[len(_DATA_PREFIX):]
+
+
+def start_foldseek_server(name: str, db_path: Path, shm_db: bool = False):
+    """Start a long-lived Foldseek container that searches are exec'd into.
+
+    Returns the in-container DB path to search against (a /dev/shm copy when
+    ``shm_db`` is set), or None if the container could not be started.
+    """
+    docker_db = _docker_path(db_path)
     if not db_path.is_absolute():
-        db_path = script_dir_abs / db_path
-    if not out_tsv.is_absolute():
-        out_tsv = script_dir_abs / out_tsv
-    if not tmp_dir.is_absolute():
-        tmp_dir = script_dir_abs / tmp_dir
-    
-    # Docker paths (inside container)
-    docker_query = f"/data/{query_pdb.relative_to(script_dir_abs)}"
-    docker_db = f"/data/{db_path.relative_to(script_dir_abs)}"
-    docker_output = f"/data/{out_tsv.relative_to(script_dir_abs)}"
-    docker_tmp = f"/data/{tmp_dir.relative_to(script_dir_abs)}"
+        db_path = SCRIPT_DIR / db_path
+
+    cmd = ["docker", "run", "-d", "--rm", "--name", name,
+           "-v", f"{SCRIPT_DIR}:/data"]
+    if shm_db:
+        # Size /dev/shm to hold every DB file plus some headroom
+        db_bytes = _db_size(db_path)
+        cmd.extend(["--shm-size", str(db_bytes + db_bytes // 10 + (64 << 20))])
+    cmd.extend(["--entrypoint", "sleep", "foldseek", "infinity"])
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print_msg("33", f"Could not start Foldseek server container: {result.stderr.strip()}")
+        return None
+    atexit.register(subprocess.run, ["docker", "rm", "-f", name], capture_output=True)
+    print_msg("34", f"Started Foldseek server container: {name}")
+
+    if shm_db:
+        shm_dir = "/dev/shm/fs_db"
+        copy_cmd = ["docker", "exec", name, "sh", "-c", f'mkdir -p {shm_dir} && cp "{docker_db}"* {shm_dir}/']
+        result = subprocess.run(copy_cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            print_msg("34", f"Copied database into {shm_dir}")
+            return f"{shm_dir}/{db_path.name}"
+        print_msg("33", f"Could not copy database into {shm_dir}, using mounted DB: {result.stderr.strip()}")
+
+    return docker_db
+
+
+@functools.lru_cache(maxsize=None)
+def _param_args(param_items: tuple, with_tmscore: bool) -> tuple:
+    """Foldseek option arguments for a hashable ``tuple(params.items())`` snapshot."""
+    params = dict(param_items)
+    args = (
+        "-s", str(params['sensitivity']),
+        "-e", str(params['evalue']),
+        "--max-seqs", str(params['max_seqs']),
+        "--threads", str(params['threads']),
+        "-c", str(params['coverage']),
+        "--min-seq-id", str(params['min_seq_id']),
+        "--alignment-mode", str(params['alignment_mode']),
+        "--db-load-mode", str(params['db_load_mode']),
+        "--remove-tmp-files", str(params['remove_tmp_files'])
+    )
+
+    # Only pass TM-score threshold for databases that include CA coordinates
+    if with_tmscore:
+        args += ("--tmscore-threshold", str(params['tmscore_threshold']))
+    return args
+
+
+def is_prostt5_database(db_path: Path) -> bool:
+    """Detect ProstT5 databases (created from FASTA).
+
+    These do not contain "*_ca" files and therefore cannot output TM-score
+    related fields or accept TM-score thresholds.
+    """
+    return not Path(f"{db_path}_ca").exists()
+
+
+def effective_output_format(fmt: str, is_prostt5_db: bool) -> str:
+    """Adjust the output format for ProstT5 DBs by removing TM-score dependent fields."""
+    if not (is_prostt5_db and fmt):
+        return fmt
+    # Remove 'alntmscore' if present in the comma-separated format list
+    fields = [f.strip() for f in fmt.split(',')]
+    fields = [f for f in fields if f.lower() != 'alntmscore']
+    return ','.join(fields) if fields else 'query,target,evalue,bits'
+
+
+def run_foldseek_docker(query_pdb: Path, db_path: Path, out_tsv: Path, tmp_dir: Path, effective_format: str, params: dict,
+                        is_prostt5_db: bool = False, container: str = None, container_db: str = None,
+                        verbose: bool = False) -> tuple:
+    """Run Foldseek using Docker container with mounted volumes.
+
+    ``query_pdb`` may be a single PDB file or a directory of PDB files, in which
+    case all of them are searched in one call and the target DB is loaded once.
+    ``effective_format`` and ``is_prostt5_db`` are computed once by the caller
+    (see effective_output_format). When ``container`` is given the search is
+    exec'd into that running server container, against ``container_db`` if
+    provided.
+
+    Returns ``(returncode, stderr_tail)``. Foldseek's stdout is discarded and
+    only the last STDERR_TAIL_LINES lines of stderr are kept.
+    """
+
+    # Docker paths (inside container); relative paths are taken relative to the
+    # script directory, which is what gets mounted at /data
+    docker_query = _docker_path(query_pdb)
+    docker_db = container_db or _docker_path(db_path)
+    docker_output = _docker_path(out_tsv)
+    docker_tmp = _docker_path(tmp_dir)
     
-    # Detect ProstT5 databases (created from FASTA). These do not contain "*_ca" files
-    # and therefore cannot output TM-score related fields or accept TM-score thresholds.
-    ca_sidecar_path = Path(f"{db_path}_ca")
-    is_prostt5_db = not ca_sidecar_path.exists()
-
-    # Adjust output format for ProstT5 DBs by removing TM-score dependent fields
-    effective_format = fmt
-    if is_prostt5_db and fmt:
-        # Remove 'alntmscore' if present in the comma-separated format list
-        try:
-            fields = [f.strip() for f in fmt.split(',')]
-            fields = [f for f in fields if f.lower() != 'alntmscore']
-            effective_format = ','.join(fields) if fields else 'query,target,evalue,bits'
-        except Exception:
-            # Fallback to a safe minimal format if parsing fails
-            effective_format = 'query,target,evalue,bits'
+    if container:
+        prefix = [*_FS_EXEC_PREFIX, container]
+    else:
+        prefix = [*_FS_RUN_PREFIX, "-v", f"{SCRIPT_DIR}:/data"]
 
     cmd = [
-        "docker", "run", "--rm",
-        "-v", f"{script_dir_abs}:/data",
-        "foldseek",
+        *prefix, "foldseek",
         "easy-search",
         docker_query,
         docker_db,
         docker_output,
         docker_tmp,
         "--format-output", effective_format,
-        "-s", str(params['sensitivity']),
-        "-e", str(params['evalue']),
-        "--max-seqs", str(params['max_seqs']),
-        "--threads", str(params['threads']),
-        "-c", str(params['coverage']),
-        "--min-seq-id", str(params['min_seq_id']),
-        "--alignment-mode", str(params['alignment_mode'])
+        *_param_args(tuple(params.items()), not is_prostt5_db)
     ]
-
-    # Only pass TM-score threshold for databases that include CA coordinates
-    if not is_prostt5_db:
-        cmd.extend(["--tmscore-threshold", str(params['tmscore_threshold'])])
     
-    print_msg("36", f"Running: {' '.join(cmd)}")
-    return subprocess.run(cmd).returncode
+    if verbose:
+        print_msg("36", "Running: " + shlex.join(cmd))
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                            start_new_session=True)
+    with _RUNNING_LOCK:
+        _RUNNING.add(proc)
+    try:
+        tail = deque(proc.stderr, maxlen=STDERR_TAIL_LINES)
+        return proc.wait(), ''.join(tail)
+    finally:
+        with _RUNNING_LOCK:
+            _RUNNING.discard(proc)
+
+
+def stop_running_searches(container: str = None):
+    """Stop every running search.
+
+    Searches exec'd into the server ``container`` keep running when their
+    docker exec client is terminated, so the container itself is removed.
+    Fallback ``docker run`` clients proxy SIGTERM to their own container.
+    """
+    if container:
+        subprocess.run(["docker", "rm", "-f", container], capture_output=True)
+    with _RUNNING_LOCK:
+        running = list(_RUNNING)
+    for proc in running:
+        proc.terminate()
+
+
+def _exit_on_signal(signum, frame):
+    """Turn SIGTERM into SystemExit so interrupt handling and atexit cleanup run."""
+    raise SystemExit(128 + signum)
+
+
+def stage_queries(pdb_files: list, stage_dir: Path):
+    """Collect query PDBs into one directory so a single easy-search covers them all."""
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    for pdb_file in pdb_files:
+        staged = stage_dir / pdb_file.name
+        # Hard links keep the staged entries regular files that also resolve inside
+        # the container's /data mount; fall back to a copy across filesystems.
+        try:
+            os.link(pdb_file, staged)
+        except OSError:
+            shutil.copy2(pdb_file, staged)
+
+
+def _query_owner(query: str, owners: dict, cut_owners: dict) -> tuple:
+    """Map a Foldseek query name (possibly carrying a chain suffix) to the PDB stems it may belong to.
+
+    Foldseek cuts query names at the first whitespace, so names that only match
+    after that cut are looked up in ``cut_owners`` and may be ambiguous. Both
+    tables are checked at every suffix level, longest name first, so a cut name
+    is never shadowed by a shorter exact name.
+    """
+    name = query
+    while True:
+        candidates = owners.get(name, ()) + cut_owners.get(name, ())
+        if candidates:
+            return tuple(dict.fromkeys(candidates))
+        if '_' not in name:
+            return ()
+        name = name.rsplit('_', 1)[0]
+
+
+def split_results(combined_tsv: Path, pdb_files: list, output_dir: Path, drop_query: bool = False) -> tuple:
+    """Split a combined easy-search TSV into one <stem>_fs.tsv per query PDB.
+
+    The first column must be the query. With ``drop_query`` that column was
+    only added for the split and is removed from the per-query files.
+
+    Returns ``(unassigned, incomplete)``: the number of result lines that could
+    not be assigned to a single query, and the stems whose results may be
+    missing some of those lines.
+    """
+    # A single query owns every line, whatever Foldseek named it
+    if len(pdb_files) == 1:
+        out_tsv = output_dir / f"{pdb_files[0].stem}_fs.tsv"
+        if combined_tsv.exists():
+            os.replace(combined_tsv, out_tsv)
+        else:
+            out_tsv.write_text("")
+        return 0, set()
+
+    owners = {}
+    cut_owners = {}
+    for pdb_file in pdb_files:
+        owners[pdb_file.name] = (pdb_file.stem,)
+        owners[pdb_file.stem] = (pdb_file.stem,)
+        parts = pdb_file.stem.split(maxsplit=1)
+        if len(parts) > 1:
+            cut_owners[parts[0]] = cut_owners.get(parts[0], ()) + (pdb_file.stem,)
+
+    # Every query gets an output file, even when it has no hits
+    for pdb_file in pdb_files:
+        (output_dir / f"{pdb_file.stem}_fs.tsv").write_text("")
+
+    # Results are grouped by query, so only the current output file is kept open
+    resolved = {}
+    assigned = set()
+    incomplete = set()
+    unassigned = 0
+    unowned = False
+    current_stem = None
+    current = None
+    try:
+        with open(combined_tsv) as f:
+            for line in f:
+                query, _, rest = line.partition('\t')
+                if query not in resolved:
+                    resolved[query] = _query_owner(query, owners, cut_owners)
+                candidates = resolved[query]
+                if len(candidates) != 1:
+                    unassigned += 1
+                    incomplete.update(candidates)
+                    unowned = unowned or not candidates
+                    continue
+                stem = candidates[0]
+                assigned.add(stem)
+                if stem != current_stem:
+                    if current:
+                        current.close()
+                    current = open(output_dir / f"{stem}_fs.tsv", 'a')
+                    current_stem = stem
+                current.write((rest or '\n') if drop_query else line)
+    finally:
+        if current:
+            current.close()
+
+    # Lines that matched no query at all may belong to any query left without results
+    if unowned:
+        incomplete.update(p.stem for p in pdb_files if p.stem not in assigned)
+    return unassigned, incomplete
+
+
+def write_atomic(path: Path, text: str):
+    """Write text to path via a temporary file and rename, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
 
 
 def create_job_completion_marker(output_dir: Path, job_id: str, success: bool = True):
@@ -256,11 +473,9 @@ def create_job_completion_marker(output_dir: Path, job_id: str, success: bool =
         marker_file = output_dir / f"{job_id}.done.txt"
         status = "SUCCESS" if success else "FAILED"
         try:
-            import datetime
-            timestamp = datetime.datetime.now().isoformat()
-            with open(marker_file, 'w') as f:
-                f.write(f"Job {job_id} completed with status: {status}\n")
-                f.write(f"Timestamp: {timestamp}\n")
+            timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+            write_atomic(marker_file, f"Job {job_id} completed with status: {status}\n"
+                                      f"Timestamp: {timestamp}\n")
             print_msg("32", f"Created completion marker: {marker_file}")
         except Exception as e:
             print_msg("31", f"Failed to create completion marker: {e}")
@@ -268,20 +483,13 @@ def create_job_completion_marker(output_dir: Path, job_id: str, success: bool =
 
 def main():
     """Main function."""
-    input_dir, output_dir, db_path, tmp_dir, fmt, params, query_file, job_id = parse_args()
+    input_dir, output_dir, db_path, tmp_dir, fmt, params, query_file, job_id, parallel, shm_db, verbose = parse_args()
 
-    # Check if Docker is available
-    try:
-        subprocess.run(["docker", "--version"], capture_output=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print_msg("31", "Docker is not available or not running")
-        return 1
+    # A terminated run must still remove its server container and /dev/shm copy
+    signal.signal(signal.SIGTERM, _exit_on_signal)
 
-    # Check if foldseek image exists
-    try:
-        subprocess.run(["docker", "images", "-q", "foldseek"], capture_output=True, check=True)
-    except subprocess.CalledProcessError:
-        print_msg("31", "Foldseek Docker image not found. Please build it first with: docker build -t foldseek .")
+    # Check that Docker and the foldseek image are available
+    if not preflight():
         return 1
 
     if not db_path.exists():
@@ -292,6 +500,13 @@ def main():
         print_msg("31", f"Input directory {input_dir} not found")
         return 1
 
+    is_prostt5_db = is_prostt5_database(db_path)
+    effective_format = effective_output_format(fmt, is_prostt5_db)
+
+    # Splitting a combined TSV needs the query in the first column; add it for
+    # multi-PDB batches when the requested format does not start with it
+    add_query = bool(effective_format) and effective_format.split(',')[0].strip().lower() != 'query'
+
     # Create output and tmp directories
     output_dir.mkdir(parents=True, exist_ok=True)
     tmp_dir.mkdir(parents=True, exist_ok=True)
@@ -321,7 +536,9 @@ def main():
         pdb_files = [query_path]
     else:
         # Find all PDB files in input directory
-        pdb_files = list(input_dir.glob("*.pdb"))
+        with os.scandir(input_dir) as entries:
+            pdb_files = [Path(e.path) for e in entries if e.name.endswith('.pdb') and e.is_file()]
+        pdb_files.sort(key=lambda p: p.name)
         if not pdb_files:
             print_msg("33", f"No PDB files found in {input_dir}")
             return 0
@@ -329,21 +546,95 @@ def main():
     print_msg("34", f"Found {len(pdb_files)} PDB file(s) to process")
     print_msg("34", f"Parameters: sensitivity={params['sensitivity']}, evalue={params['evalue']}, max-seqs={params['max_seqs']}")
     
+    # Search the queries in batches so the target DB is loaded once per batch rather
+    # than once per PDB. With --parallel N the queries are split into N batches that
+    # run side by side, sharing the CPU budget so the host is not oversubscribed.
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(len(pdb_files), parallel))
+    job_params = dict(params, threads=max(1, min(params['threads'], cpu_count // workers)))
+    batches = [pdb_files[i::workers] for i in range(workers)]
+    print_msg("34", f"Running {workers} batch(es) with {job_params['threads']} thread(s) each")
+
+    # With several batches (or a /dev/shm DB) keep one container, and the DB pages
+    # it has touched, alive for all of them instead of paying container start-up
+    # per search; a single search is cheapest as one plain docker run. A DB copied
+    # into /dev/shm is already resident, so plain mmap is enough there.
+    if shm_db and not _shm_fits(db_path):
+        print_msg("33", "Database does not fit in available RAM, searching the mounted DB instead of /dev/shm")
+        shm_db = False
+    container = container_db = None
+    if workers > 1 or shm_db:
+        server_name = f"fs_srv_{os.getpid()}"
+        container_db = start_foldseek_server(server_name, db_path, shm_db)
+        container = server_name if container_db else None
+        if container_db and container_db.startswith("/dev/shm/"):
+            job_params['db_load_mode'] = 2
+
     successful_jobs = 0
     failed_jobs = 0
 
-    for pdb_file in pdb_files:
-        out_tsv = output_dir / f"{pdb_file.stem}_fs.tsv"
-        
-        print_msg("36", f"Processing {pdb_file.name}...")
-        ret = run_foldseek_docker(pdb_file, db_path, out_tsv, tmp_dir, fmt, params)
-        
-        if ret == 0:
-            print_msg("32", f"   ✓ {pdb_file.name} → {out_tsv.name}")
-            successful_jobs += 1
-        else:
-            print_msg("31", f"   × Foldseek failed ({ret}) for {pdb_file.name}")
-            failed_jobs += 1
+    # Staged queries and combined results live in a directory of their own so
+    # overlapping runs sharing tmp_dir (e.g. uploads without --job-id) never
+    # touch each other's files
+    run_tmp_dir = Path(tempfile.mkdtemp(prefix="run_", dir=tmp_dir))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                futures = {}
+                for index, batch in enumerate(batches):
+                    # Per-batch tmp directory so concurrent searches do not collide
+                    batch_dir = run_tmp_dir / f"batch_{index}"
+                    query_dir = batch_dir / "queries"
+                    search_tmp_dir = batch_dir / "tmp"
+                    search_tmp_dir.mkdir(parents=True, exist_ok=True)
+                    stage_queries(batch, query_dir)
+                    combined_tsv = batch_dir / "combined.tsv"
+                    batch_format = f"query,{effective_format}" if add_query and len(batch) > 1 else effective_format
+
+                    for pdb_file in batch:
+                        print_msg("36", f"Processing {pdb_file.name}...")
+                    future = executor.submit(run_foldseek_docker, query_dir, db_path, combined_tsv, search_tmp_dir,
+                                             batch_format, job_params, is_prostt5_db=is_prostt5_db,
+                                             container=container, container_db=container_db, verbose=verbose)
+                    futures[future] = (batch, combined_tsv)
+
+                for future in as_completed(futures):
+                    batch, combined_tsv = futures[future]
+                    stderr_tail = ""
+                    try:
+                        ret, stderr_tail = future.result()
+                        incomplete = set()
+                        if ret == 0:
+                            unassigned, incomplete = split_results(combined_tsv, batch, output_dir,
+                                                                   drop_query=add_query)
+                            if unassigned:
+                                print_msg("33", f"   ! {unassigned} result line(s) did not match a single query")
+                    except Exception as e:
+                        print_msg("31", f"   × Batch failed: {e}")
+                        ret = 1
+
+                    for pdb_file in batch:
+                        if ret != 0:
+                            print_msg("31", f"   × Foldseek failed ({ret}) for {pdb_file.name}")
+                            failed_jobs += 1
+                        elif pdb_file.stem in incomplete:
+                            print_msg("31", f"   × Could not match all results to {pdb_file.name}")
+                            failed_jobs += 1
+                        else:
+                            print_msg("32", f"   ✓ {pdb_file.name} → {pdb_file.stem}_fs.tsv")
+                            successful_jobs += 1
+                    if ret != 0 and stderr_tail:
+                        print_msg("31", f"Foldseek stderr:\n{stderr_tail}")
+            except (KeyboardInterrupt, SystemExit) as e:
+                print_msg("31", "Interrupted, stopping running searches")
+                stop_running_searches(container)
+                executor.shutdown(wait=False, cancel_futures=True)
+                return e.code if isinstance(e, SystemExit) else 130
+    finally:
+        # Searches write root-owned files here, so removal is best effort
+        if params['remove_tmp_files']:
+            shutil.rmtree(run_tmp_dir, ignore_errors=True)
 
     print_msg("32", f"Completed: {successful_jobs} successful, {failed_jobs} failed")
     
@@ -355,14 +646,14 @@ def main():
         # Also create job info file with details
         job_info_file = output_dir / f"{job_id}_info.txt"
         try:
-            with open(job_info_file, 'w') as f:
-                f.write(f"Job ID: {job_id}\n")
-                f.write(f"Processed files: {len(pdb_files)}\n")
-                f.write(f"Successful: {successful_jobs}\n")
-                f.write(f"Failed: {failed_jobs}\n")
-                f.write(f"Parameters: {params}\n")
-                f.write(f"Database: {db_path}\n")
-                f.write(f"Output format: {fmt}\n")
+            write_atomic(job_info_file,
+                         f"Job ID: {job_id}\n"
+                         f"Processed files: {len(pdb_files)}\n"
+                         f"Successful: {successful_jobs}\n"
+                         f"Failed: {failed_jobs}\n"
+                         f"Parameters: {params}\n"
+                         f"Database: {db_path}\n"
+                         f"Output format: {fmt}\n")
         except Exception as e:
             print_msg("31", f"Failed to create job info file: {e}")
     
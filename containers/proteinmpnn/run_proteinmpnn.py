@@ -1,15 +1,65 @@
 #!/usr/bin/env python3
 """
-Simple script to run ProteinMPNN by copying PDB files into the container.
-This avoids volume mounting issues and works reliably across different systems.
+Simple script to benchmark ProteinMPNN in Docker. The input and output
+directories are bind-mounted into the container, so nothing is copied in or out.
+A single container is started for the whole benchmark and runs are sent to
+a persistent worker inside it (worker.py), so container start-up, torch import
+and model loading are paid once. All PDB files are parsed into one multi-target
+JSONL and each configuration runs over all of them in a single ProteinMPNN call.
+Configurations run concurrently on as many workers as fit in free GPU memory;
+set PROTEINMPNN_MPS=1 to share the GPU between them through CUDA MPS.
 """
 
+import argparse
+import os
+import json
+import queue
+import re
+import select
+import shutil
 import subprocess
+import tempfile
 import time
 import csv
-from datetime import datetime
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from pathlib import Path
 
+SCRIPT_DIR = Path(__file__).parent
+WORKER_SCRIPT = SCRIPT_DIR / "worker.py"
+
+# Single GPU the benchmark runs on (PROTEINMPNN_GPU, default 0)
+GPU_DEVICE = os.environ.get('PROTEINMPNN_GPU', '0')
+
+# Each run logs to this file in its output folder; failures report its tail
+LOG_NAME = 'proteinmpnn.log'
+LOG_TAIL_CHARS = 4096
+
+# Seconds ProteinMPNN may take per input file before a run is abandoned
+RUN_TIMEOUT = 300
+
+# CSV columns, in order; rows are written positionally
+ROW_ORDER = (
+    'timestamp', 'input_file', 'file_size_kb', 'num_sequences', 'temperature',
+    'runtime_seconds', 'success', 'gpu_used', 'sequences_generated', 'output_files'
+)
+BenchmarkRow = namedtuple('BenchmarkRow', ROW_ORDER)
+
+# Approximate peak GPU memory of one ProteinMPNN worker (MiB)
+WORKER_GPU_MEM_MB = 2048
+
+# Opt-in CUDA MPS so concurrent workers share the GPU instead of time-slicing
+USE_MPS = os.environ.get('PROTEINMPNN_MPS') == '1'
+MPS_PIPE_DIR = '/tmp/nvidia-mps'
+
+# Multi-target input shared by every configuration (inside the container)
+PARSE_SCRIPT = '/app/helper_scripts/parse_multiple_chains.py'
+PARSED_JSONL = '/tmp/parsed_pdbs.jsonl'
+
+# protein_mpnn_run.py prints one of these lines per target, in input order
+_TIMING_RE = re.compile(r'(\d+) sequences of length \d+ generated in ([\d.]+) seconds')
+
 def check_docker():
     """Check if Docker is available and running."""
     try:
@@ -19,7 +69,7 @@ def check_docker():
             return False
         
         # Check if Docker daemon is running
-        result = subprocess.run(['docker', 'info'], capture_output=True, text=True)
+        result = subprocess.run(['docker', 'info'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         if result.returncode != 0:
             print("Error: Docker daemon is not running")
             return False
@@ -29,84 +79,280 @@ def check_docker():
         print("Error: Docker is not installed")
         return False
 
+def ensure_image():
+    """Build the proteinmpnn image if it is not available locally."""
+    result = subprocess.run(['docker', 'image', 'inspect', 'proteinmpnn'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if result.returncode == 0:
+        return True
+    
+    print("Building proteinmpnn image...")
+    result = subprocess.run(['docker', 'build', '-t', 'proteinmpnn', str(SCRIPT_DIR)])
+    if result.returncode != 0:
+        print("Error: Failed to build the proteinmpnn image")
+        return False
+    return True
+
 def check_gpu_support():
     """Check if GPU support is available."""
+    # Set PROTEINMPNN_TORCH_GPU_CHECK=1 to ask torch inside the container instead
+    if os.environ.get('PROTEINMPNN_TORCH_GPU_CHECK') == '1':
+        try:
+            result = subprocess.run(['docker', 'run', '--rm', '--gpus', f'device={GPU_DEVICE}', 'proteinmpnn', 'python', '-c', 'import torch; print(torch.cuda.is_available())'], 
+                                  capture_output=True, text=True, timeout=30)
+            return result.returncode == 0 and 'True' in result.stdout
+        except:
+            return False
+    
+    # Otherwise a GPU on the host and the NVIDIA runtime in Docker are enough
+    try:
+        subprocess.run(['nvidia-smi', '-L'], capture_output=True, check=True, timeout=2)
+        result = subprocess.run(['docker', 'info', '--format', '{{json .Runtimes}}'],
+                                capture_output=True, text=True, timeout=10)
+        return result.returncode == 0 and 'nvidia' in result.stdout
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return False
+
+def worker_count(num_jobs, use_gpu=True):
+    """Number of concurrent workers: as many as fit in free GPU memory, one on CPU."""
+    if not use_gpu:
+        return 1
     try:
-        # Test GPU support using our own proteinmpnn container
-        result = subprocess.run(['docker', 'run', '--rm', '--gpus', 'all', 'proteinmpnn', 'python', '-c', 'import torch; print(torch.cuda.is_available())'], 
-                              capture_output=True, text=True, timeout=30)
-        return result.returncode == 0 and 'True' in result.stdout
-    except:
+        result = subprocess.run(['nvidia-smi', '-i', GPU_DEVICE, '--query-gpu=memory.free', '--format=csv,noheader,nounits'],
+                                capture_output=True, text=True, timeout=10)
+        free_mb = int(result.stdout.split('\n')[0])
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return 1
+    return max(1, min(num_jobs, free_mb // WORKER_GPU_MEM_MB))
+
+def start_mps():
+    """Start the CUDA MPS control daemon; return True if the container should use it."""
+    try:
+        result = subprocess.run(['nvidia-cuda-mps-control', '-d'], capture_output=True, text=True)
+    except FileNotFoundError:
+        print("⚠ nvidia-cuda-mps-control not found, running without MPS")
         return False
+    if result.returncode != 0:
+        print(f"⚠ Could not start CUDA MPS, running without it: {result.stderr.strip()}")
+        return False
+    print("✓ CUDA MPS started")
+    return True
+
+def stop_mps():
+    """Shut down the CUDA MPS control daemon."""
+    subprocess.run(['nvidia-cuda-mps-control'], input='quit\n', capture_output=True, text=True)
+
+def start_container(container_name, input_dir, output_dir, use_gpu=True, use_mps=False, unsafe_fast=False):
+    """Start the benchmark container with the input, output and worker mounted."""
+    # Run as the caller so everything ProteinMPNN writes into output/ is theirs
+    start_cmd = ['docker', 'run', '-d', '--rm', '--name', container_name,
+                 '--user', f'{os.getuid()}:{os.getgid()}']
+    if use_gpu:
+        start_cmd.extend(['--gpus', f'device={GPU_DEVICE}'])
+    if use_mps:
+        # Workers reach the host MPS daemon through its pipe directory
+        start_cmd.extend(['--ipc=host', '-v', f'{MPS_PIPE_DIR}:{MPS_PIPE_DIR}'])
+    if unsafe_fast:
+        # Trade container isolation for less syscall filtering overhead
+        start_cmd.extend(['--security-opt', 'seccomp=unconfined', '--security-opt', 'apparmor=unconfined',
+                          '--network=host'])
+        if not use_mps:
+            start_cmd.append('--ipc=host')
+    start_cmd.extend([
+        '-v', f'{input_dir.absolute()}:/data/input:ro',
+        '-v', f'{output_dir.absolute()}:/data/output',
+        '-v', f'{WORKER_SCRIPT.absolute()}:/app/worker.py:ro',
+        'proteinmpnn', 'tail', '-f', '/dev/null'  # Keep container running
+    ])
+    
+    print(f"Starting container: {container_name}")
+    result = subprocess.run(start_cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to start container: {result.stderr}")
+
+def start_worker(container_name):
+    """Start the persistent ProteinMPNN worker inside the container."""
+    worker = subprocess.Popen(['docker', 'exec', '-i', container_name, 'python', '/app/worker.py'],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                              start_new_session=True)
+    # The worker announces itself, with its pid in the container, once torch is imported
+    line = worker.stdout.readline()
+    if not line:
+        worker.wait()
+        raise Exception(f"ProteinMPNN worker failed to start (exit code {worker.returncode})")
+    worker.container_pid = json.loads(line)['pid']
+    return worker
+
+def kill_worker(container_name, worker):
+    """Kill a worker inside the container as well as its docker exec client."""
+    # The shell builtin works even though the image does not ship procps
+    result = subprocess.run(['docker', 'exec', container_name, 'sh', '-c', f'kill -9 {worker.container_pid}'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"  Warning: Failed to kill ProteinMPNN worker {worker.container_pid}: {result.stderr.strip()}")
+    worker.kill()
+    worker.wait()
 
-def run_proteinmpnn_on_file(pdb_file, output_dir, num_sequences=5, temperature=0.1, seed=37, use_gpu=True):
-    """Run ProteinMPNN on a single PDB file by copying it into the container."""
+def stop_worker(worker):
+    """Ask the worker to exit by closing its input, killing it if it does not."""
+    if worker.poll() is None:
+        worker.stdin.close()
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+            worker.wait()
+
+def stop_container(container_name):
+    """Remove the benchmark container."""
+    subprocess.run(['docker', 'rm', '-f', container_name], capture_output=True, text=True)
+
+def parse_inputs(container_name):
+    """Parse all PDB files in the container into PARSED_JSONL; return target names in order."""
+    parse_cmd = ['docker', 'exec', container_name, 'python', PARSE_SCRIPT,
+                 '--input_path=/data/input/', f'--output_path={PARSED_JSONL}']
+    print("Parsing input PDB files...")
+    result = subprocess.run(parse_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to parse input PDB files: {result.stderr}")
     
-    print(f"  Processing {pdb_file.name}...")
+    names_cmd = ['docker', 'exec', container_name, 'python', '-c',
+                 "import json, sys\nfor line in open(sys.argv[1]): print(json.loads(line)['name'])",
+                 PARSED_JSONL]
+    result = subprocess.run(names_cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to read parsed targets: {result.stderr}")
+    return result.stdout.split('\n')[:-1]
+
+def read_log(log_path):
+    """Read a run log, or return an empty string if the run never wrote one."""
+    try:
+        return log_path.read_text(errors='replace')
+    except OSError:
+        return ''
+
+def target_timings(log, names):
+    """Map target names to their generation time from ProteinMPNN's log, if it lines up."""
+    times = [float(m.group(2)) for m in _TIMING_RE.finditer(log)]
+    if len(times) != len(names):
+        return {}
+    return dict(zip(names, times))
+
+def run_proteinmpnn_batch(output_dir, container_name, worker, num_targets, num_sequences=5, temperature=0.1, seed=37):
+    """Run ProteinMPNN on every parsed input file through the worker in the benchmark container."""
+    
+    # Each configuration writes to its own folder of the mounted output directory
+    container_output = f'/data/output/{output_dir.name}'
     
-    # Create output directory
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # Send the run to the worker
+    run_args = [
+        '--jsonl_path', PARSED_JSONL,
+        '--out_folder', container_output,
+        '--num_seq_per_target', str(num_sequences),
+        '--sampling_temp', str(temperature),
+        '--seed', str(seed)
+    ]
     
-    # Verify input file exists
-    if not pdb_file.exists():
-        raise FileNotFoundError(f"Input PDB file not found: {pdb_file}")
+    print(f"  Running ProteinMPNN on {num_targets} files with {num_sequences} sequences, temperature {temperature}...")
+    worker.stdin.write(json.dumps({'args': run_args, 'log': f'{container_output}/{LOG_NAME}'}) + '\n')
+    worker.stdin.flush()
     
-    # Create a temporary container to copy the file and run ProteinMPNN
-    container_name = f"proteinmpnn_temp_{int(time.time())}"
+    # Wait for the reply; a worker stuck past the timeout is killed so it stops
+    # using the GPU, and is restarted by the caller
+    timeout = RUN_TIMEOUT * num_targets
+    ready, _, _ = select.select([worker.stdout], [], [], timeout)
+    if not ready:
+        kill_worker(container_name, worker)
+        raise subprocess.TimeoutExpired(run_args, timeout)
+    line = worker.stdout.readline()
+    if not line:
+        raise Exception(f"ProteinMPNN worker exited unexpectedly (exit code {worker.wait()})")
+    reply = json.loads(line)
+    return subprocess.CompletedProcess(run_args, reply['returncode'])
+
+def wall_time(bench_start):
+    """Current wall-clock time from a (datetime, time.monotonic()) benchmark start."""
+    start_wall, start_mono = bench_start
+    return start_wall + timedelta(seconds=time.monotonic() - start_mono)
+
+def run_config(config, file_meta, target_names, run_output_dir, workers, container_name, gpu_available, bench_start):
+    """Benchmark one configuration over all (pdb_file, size_kb, stem) entries; return (run_output_dir, rows)."""
     
+    worker = workers.get()
     try:
-        # Step 1: Start a container in detached mode
-        start_cmd = ['docker', 'run', '-d', '--name', container_name]
-        if use_gpu:
-            start_cmd.extend(['--gpus', 'all'])
-        start_cmd.extend(['proteinmpnn', 'tail', '-f', '/dev/null'])  # Keep container running
-        
-        print(f"  Starting container: {container_name}")
-        result = subprocess.run(start_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Failed to start container: {result.stderr}")
-        
-        # Step 2: Copy PDB file into container
-        copy_cmd = ['docker', 'cp', str(pdb_file), f'{container_name}:/data/input/{pdb_file.name}']
-        print(f"  Copying {pdb_file.name} into container...")
-        result = subprocess.run(copy_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Failed to copy file: {result.stderr}")
+        # Replace a worker that died or was killed on a timeout
+        if worker.poll() is not None:
+            worker = start_worker(container_name)
         
-        # Step 3: Run ProteinMPNN using docker exec
-        run_cmd = [
-            'docker', 'exec', container_name,
-            'python', '/app/protein_mpnn_run.py',
-            '--pdb_path', f'/data/input/{pdb_file.name}',
-            '--out_folder', '/data/output',
-            '--num_seq_per_target', str(num_sequences),
-            '--sampling_temp', str(temperature),
-            '--seed', str(seed)
-        ]
-        
-        print(f"  Running ProteinMPNN with {num_sequences} sequences, temperature {temperature}...")
-        result = subprocess.run(run_cmd, capture_output=True, text=True, timeout=300)
+        # Run ProteinMPNN on all files at once
+        start_time = time.monotonic()
+        result = run_proteinmpnn_batch(
+            run_output_dir, container_name, worker, len(file_meta),
+            num_sequences=config['num_sequences'],
+            temperature=config['temperature']
+        )
+        batch_runtime = time.monotonic() - start_time
+    except Exception as e:
+        print(f"✗ Error benchmarking {config['num_sequences']} sequences, temperature {config['temperature']}: {e}")
         
-        # Step 4: Copy results back
-        if result.returncode == 0:
-            copy_back_cmd = ['docker', 'cp', f'{container_name}:/data/output/.', str(output_dir)]
-            print(f"  Copying results back...")
-            copy_result = subprocess.run(copy_back_cmd, capture_output=True, text=True)
-            if copy_result.returncode != 0:
-                print(f"  Warning: Failed to copy results back: {copy_result.stderr}")
+        # Log the error
+        row_ts = wall_time(bench_start).strftime('%Y-%m-%d %H:%M:%S')
+        rows = [BenchmarkRow(
+            row_ts, pdb_file.name, round(file_size_kb, 2),
+            config['num_sequences'], config['temperature'], 0, False, False, 0, 0
+        ) for pdb_file, file_size_kb, _ in file_meta]
+        return run_output_dir, rows
+    finally:
+        workers.put(worker)
+    
+    log = read_log(run_output_dir / LOG_NAME)
+    if result.returncode != 0:
+        print(f"✗ ProteinMPNN failed for {config['num_sequences']} sequences, temperature {config['temperature']}")
+        print(f"  Error: {log[-LOG_TAIL_CHARS:]}")
+    
+    # Per-target times from the log; ProteinMPNN writes seqs/<name>.fa for
+    # every target it did not skip, in input order
+    seqs_dir = run_output_dir / "seqs"
+    
+    # Walk the run tree once: output file counts by stem, and the .fa files in seqs/
+    files_by_stem = Counter()
+    fa_names = set()
+    for dirpath, _, filenames in os.walk(run_output_dir):
+        for name in filenames:
+            files_by_stem[os.path.splitext(name)[0]] += 1
+            if dirpath == str(seqs_dir) and name.endswith('.fa'):
+                fa_names.add(name)
+    
+    generated = [n for n in target_names if f"{n}.fa" in fa_names]
+    timings = target_timings(log, generated)
+    
+    # Every row of the configuration is stamped with its completion time
+    row_ts = wall_time(bench_start).strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    for pdb_file, file_size_kb, stem in file_meta:
+        fa_file = seqs_dir / f"{stem}.fa"
+        fa_exists = fa_file.name in fa_names
+        success = result.returncode == 0 and fa_exists
         
-        return result
+        # Count sequences; the first record of the .fa is the native sequence
+        sequences_generated = 0
+        if fa_exists:
+            with open(fa_file) as f:
+                sequences_generated = max(0, sum(1 for line in f if line.startswith('>')) - 1)
+        runtime = timings.get(stem, batch_runtime / len(file_meta))
         
-    finally:
-        # Clean up: Remove the container
-        cleanup_cmd = ['docker', 'rm', '-f', container_name]
-        subprocess.run(cleanup_cmd, capture_output=True, text=True)
+        rows.append(BenchmarkRow(
+            row_ts, pdb_file.name, round(file_size_kb, 2),
+            config['num_sequences'], config['temperature'], round(runtime, 2),
+            success, gpu_available, sequences_generated, files_by_stem[stem]
+        ))
+    return run_output_dir, rows
 
-def run_benchmark():
+def run_benchmark(unsafe_fast=False):
     """Run the benchmark for all PDB files."""
     
     # Check prerequisites
-    if not check_docker():
+    if not check_docker() or not ensure_image():
         return
     
     # Setup paths
@@ -125,18 +371,6 @@ def run_benchmark():
     else:
         print("⚠ GPU support not available, will run on CPU")
     
-    # CSV header
-    fieldnames = [
-        'timestamp', 'input_file', 'file_size_kb', 'num_sequences', 'temperature', 
-        'runtime_seconds', 'success', 'gpu_used', 'sequences_generated', 'output_files'
-    ]
-    
-    # Create CSV file with header
-    with open(csv_file, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-    print(f"Created CSV file: {csv_file}")
-    
     # Find all PDB files
     pdb_files = list(input_dir.glob("*.pdb"))
     
@@ -147,6 +381,9 @@ def run_benchmark():
     
     print(f"Found {len(pdb_files)} PDB files to benchmark")
     
+    # Stat each file once; every configuration reuses the result
+    file_meta = [(p, p.stat().st_size / 1024, p.stem) for p in pdb_files]
+    
     # Benchmark parameters
     test_configs = [
         {'num_sequences': 5, 'temperature': 0.1},
@@ -154,126 +391,129 @@ def run_benchmark():
         {'num_sequences': 3, 'temperature': 0.05}
     ]
     
-    for config in test_configs:
-        print(f"\n=== Running with {config['num_sequences']} sequences, temperature {config['temperature']} ===")
-        
-        for pdb_file in pdb_files:
-            print(f"\nBenchmarking: {pdb_file.name}")
-            
-            # Get file size
-            file_size_kb = pdb_file.stat().st_size / 1024
-            
-            # Create unique output subdirectory
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            run_output_dir = output_dir / f"{pdb_file.stem}_{config['num_sequences']}seq_{config['temperature']}temp_{timestamp}"
-            
-            # Run ProteinMPNN
-            start_time = time.time()
-            
+    # One wall-clock reading; later timestamps are offsets on the monotonic clock
+    bench_start = (datetime.now(), time.monotonic())
+    
+    # Create every configuration's output subdirectory once, unique per benchmark
+    timestamp = bench_start[0].strftime('%Y%m%d_%H%M%S')
+    run_dirs = [output_dir / f"{c['num_sequences']}seq_{c['temperature']}temp_{timestamp}" for c in test_configs]
+    for run_dir in run_dirs:
+        run_dir.mkdir(exist_ok=True)
+    
+    # One container serves every run; each concurrent configuration gets its
+    # own persistent worker process inside it
+    num_workers = worker_count(len(test_configs), use_gpu=gpu_available)
+    use_mps = gpu_available and num_workers > 1 and USE_MPS and start_mps()
+    container_name = f"proteinmpnn_bench_{os.getpid()}"
+    workers = queue.Queue()
+    try:
+        start_container(container_name, input_dir, output_dir, use_gpu=gpu_available,
+                        use_mps=use_mps, unsafe_fast=unsafe_fast)
+        target_names = parse_inputs(container_name)
+        print(f"Starting {num_workers} ProteinMPNN worker(s)...")
+        for _ in range(num_workers):
+            workers.put(start_worker(container_name))
+    except Exception as e:
+        print(f"Error: {e}")
+        while not workers.empty():
+            stop_worker(workers.get())
+        stop_container(container_name)
+        if use_mps:
+            stop_mps()
+        return
+    
+    # Create CSV file with header; it stays open for the whole benchmark and is
+    # kept in RAM until it is published to csv_file at the end
+    tmp_dir = Path('/dev/shm') if Path('/dev/shm').is_dir() else Path(tempfile.gettempdir())
+    tmp_csv = tmp_dir / f"proteinmpnn_benchmark_{os.getpid()}.csv"
+    csv_fh = open(tmp_csv, 'w', newline='')
+    writer = csv.writer(csv_fh)
+    writer.writerow(ROW_ORDER)
+    print(f"Created CSV file: {tmp_csv}")
+    
+    # Summary counters, kept as rows are written
+    n_total = 0
+    n_ok = 0
+    sum_runtime = 0.0
+    
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(run_config, config, file_meta, target_names, run_dir,
+                                workers, container_name, gpu_available, bench_start): config
+                for config, run_dir in zip(test_configs, run_dirs)
+            }
             try:
-                result = run_proteinmpnn_on_file(
-                    pdb_file, run_output_dir, 
-                    num_sequences=config['num_sequences'],
-                    temperature=config['temperature'],
-                    use_gpu=gpu_available
-                )
-                
-                end_time = time.time()
-                runtime = end_time - start_time
-                
-                # Check success and count outputs
-                success = result.returncode == 0
-                output_files = list(run_output_dir.glob("*")) if run_output_dir.exists() else []
-                sequences_generated = len([f for f in output_files if f.suffix in ['.fa', '.fasta']])
-                
-                # Prepare row data
-                row_data = {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'input_file': pdb_file.name,
-                    'file_size_kb': round(file_size_kb, 2),
-                    'num_sequences': config['num_sequences'],
-                    'temperature': config['temperature'],
-                    'runtime_seconds': round(runtime, 2),
-                    'success': success,
-                    'gpu_used': gpu_available,
-                    'sequences_generated': sequences_generated,
-                    'output_files': len(output_files)
-                }
-                
-                # Write to CSV
-                with open(csv_file, 'a', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writerow(row_data)
-                
-                if success:
-                    print(f"✓ Completed {pdb_file.name} in {runtime:.2f}s")
-                    print(f"  Generated {sequences_generated} sequences")
+                for future in as_completed(futures):
+                    config = futures[future]
+                    run_output_dir, rows = future.result()
+                    print(f"\n=== {config['num_sequences']} sequences, temperature {config['temperature']} ===")
+                    
+                    for row in rows:
+                        # Write to CSV
+                        writer.writerow(row)
+                        csv_fh.flush()
+                        
+                        n_total += 1
+                        if row.success:
+                            n_ok += 1
+                            sum_runtime += row.runtime_seconds
+                            print(f"✓ Completed {row.input_file} in {row.runtime_seconds:.2f}s")
+                            print(f"  Generated {row.sequences_generated} sequences")
+                        else:
+                            print(f"✗ Failed {row.input_file}")
+                    
                     print(f"  Output saved to: {run_output_dir}")
-                else:
-                    print(f"✗ Failed {pdb_file.name}")
-                    print(f"  Error: {result.stderr}")
-                    if result.stdout:
-                        print(f"  Output: {result.stdout}")
-                
-            except Exception as e:
-                print(f"✗ Error benchmarking {pdb_file.name}: {e}")
-                
-                # Log the error
-                row_data = {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'input_file': pdb_file.name,
-                    'file_size_kb': round(file_size_kb, 2),
-                    'num_sequences': config['num_sequences'],
-                    'temperature': config['temperature'],
-                    'runtime_seconds': 0,
-                    'success': False,
-                    'gpu_used': False,
-                    'sequences_generated': 0,
-                    'output_files': 0
-                }
-                
-                with open(csv_file, 'a', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writerow(row_data)
-            
-            # Small delay between runs
-            time.sleep(2)
+            except KeyboardInterrupt:
+                # Worker clients run in their own sessions and never see the
+                # interrupt. Cancel the pending configurations first, then remove
+                # the container to end the running ones, so the pool threads
+                # return instead of waiting out the timeout
+                print("\nInterrupted, stopping the benchmark container")
+                executor.shutdown(wait=False, cancel_futures=True)
+                stop_container(container_name)
+                return
+    
+    finally:
+        csv_fh.close()
+        while not workers.empty():
+            stop_worker(workers.get())
+        stop_container(container_name)
+        if use_mps:
+            stop_mps()
         
-        # Delay between different configurations
-        time.sleep(5)
+        # Publish last, so a failed move cannot leave the container or MPS running
+        try:
+            shutil.move(tmp_csv, csv_file)
+        except OSError as e:
+            print(f"Warning: Could not move results to {csv_file}: {e}")
+            csv_file = tmp_csv
     
     print(f"\nBenchmark completed! Results saved to {csv_file}")
     
     # Print summary
     print("\n=== BENCHMARK SUMMARY ===")
-    try:
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-            
-        successful_runs = [r for r in rows if r['success'] == 'True']
-        total_runs = len(rows)
-        
-        print(f"Total runs: {total_runs}")
-        print(f"Successful runs: {len(successful_runs)}")
-        print(f"Success rate: {len(successful_runs)/total_runs*100:.1f}%")
-        
-        if successful_runs:
-            avg_runtime = sum(float(r['runtime_seconds']) for r in successful_runs) / len(successful_runs)
-            print(f"Average runtime: {avg_runtime:.2f}s")
-            
-    except Exception as e:
-        print(f"Error generating summary: {e}")
+    print(f"Total runs: {n_total}")
+    print(f"Successful runs: {n_ok}")
+    if n_total:
+        print(f"Success rate: {n_ok/n_total*100:.1f}%")
+    
+    if n_ok:
+        print(f"Average runtime: {sum_runtime/n_ok:.2f}s")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark ProteinMPNN in Docker')
+    parser.add_argument('--unsafe-fast', action='store_true',
+                        help='Run the container without seccomp/AppArmor and with host IPC and networking')
+    args = parser.parse_args()
+    
     print("ProteinMPNN Container Processing Script")
     print("=====================================")
     print("This script will:")
     print("1. Look for PDB files in the 'input' directory")
-    print("2. Copy each PDB file into a Docker container")
-    print("3. Run ProteinMPNN inside the container")
-    print("4. Copy results back to the 'output' directory")
-    print("5. Generate a benchmark CSV file")
+    print("2. Mount the 'input' and 'output' directories into a single Docker container")
+    print("3. Run ProteinMPNN inside the container on all files per configuration")
+    print("4. Generate a benchmark CSV file")
     print()
     
-    run_benchmark() 
\ No newline at end of file
+    run_benchmark(unsafe_fast=args.unsafe_fast) 
\ No newline at end of file
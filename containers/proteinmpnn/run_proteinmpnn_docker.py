@@ -11,6 +11,9 @@ import argparse
 from pathlib import Path
 import os
 
+SCRIPT_DIR = Path(__file__).parent.resolve()
+_DATA_PREFIX = str(SCRIPT_DIR) + os.sep
+
 def print_msg(color: str, msg: str):
     """Print colored message to terminal."""
     print(f"\033[{color}m{msg}\033[0m")
@@ -52,34 +55,36 @@ def run_proteinmpnn_docker(input_file, output_dir, chains, num_designs, temperat
     import subprocess
     import shutil
     
-    script_dir = Path(__file__).parent.absolute()
+    cwd = Path.cwd()
     
     # Handle input file path - if it's relative, make it relative to current working directory
-    if Path(input_file).is_absolute():
-        input_path = Path(input_file)
-    else:
-        input_path = Path.cwd() / input_file
-    
-    output_path = (script_dir / output_dir).absolute()
+    input_path = (cwd / input_file).resolve()
+    output_path = (SCRIPT_DIR / output_dir).resolve()
     
     # Ensure input file exists
     if not input_path.exists():
         print_msg("31", f"Input file does not exist: {input_path}")
-        print_msg("31", f"Current working directory: {Path.cwd()}")
-        print_msg("31", f"Script directory: {script_dir}")
+        print_msg("31", f"Current working directory: {cwd}")
+        print_msg("31", f"Script directory: {SCRIPT_DIR}")
         return 1
     
+    # Docker paths (inside container); only SCRIPT_DIR is mounted
+    input_str, output_str = str(input_path), str(output_path)
+    for path_str in (input_str, output_str):
+        if not (path_str + os.sep).startswith(_DATA_PREFIX):
+            print_msg("31", f"{path_str} is not under {SCRIPT_DIR} and cannot be mounted into the container")
+            return 1
+    docker_input = f"/data/{input_str[len(_DATA_PREFIX):]}"
+    docker_output = f"/data/{output_str[len(_DATA_PREFIX):]}"
+    
     # Create output directory
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Docker paths (inside container)
-    docker_input = f"/data/{input_path.relative_to(script_dir)}"
-    docker_output = f"/data/{output_path.relative_to(script_dir)}"
-    
     # Build ProteinMPNN command
     cmd = [
         "docker", "run", "--rm",
-        "-v", f"{script_dir}:/data",
+        "--user", f"{os.getuid()}:{os.getgid()}",
+        "-v", f"{SCRIPT_DIR}:/data",
         "proteinmpnn",
         "python", "/app/protein_mpnn_run.py",
         "--pdb_path", docker_input,
@@ -127,41 +132,10 @@ def run_proteinmpnn_docker(input_file, output_dir, chains, num_designs, temperat
             if seqs_dir.exists():
                 print_msg("34", "Reorganizing output structure...")
                 
-                # Move all .fa files from seqs/ to the main output directory
-                fa_files = list(seqs_dir.glob("*.fa"))
-                for fa_file in fa_files:
-                    target_path = output_path / fa_file.name
-                    if target_path.exists():
-                        target_path.unlink()  # Remove existing file if it exists
-                    
-                    # Use subprocess with sudo to move the file (handle permission issues)
-                    try:
-                        result = subprocess.run(['sudo', 'mv', str(fa_file), str(target_path)], 
-                                             capture_output=True, text=True, check=True)
-                        print_msg("32", f"Moved {fa_file.name} to output directory")
-                    except subprocess.CalledProcessError as e:
-                        print_msg("31", f"Failed to move {fa_file.name}: {e}")
-                        # Fallback: try to copy and then remove
-                        try:
-                            shutil.copy2(fa_file, target_path)
-                            fa_file.unlink()
-                            print_msg("32", f"Copied {fa_file.name} to output directory")
-                        except Exception as copy_error:
-                            print_msg("31", f"Failed to copy {fa_file.name}: {copy_error}")
-                
-                # Remove the seqs directory
-                try:
-                    shutil.rmtree(seqs_dir)
-                    print_msg("32", "Removed seqs subdirectory")
-                except Exception as e:
-                    print_msg("31", f"Failed to remove seqs directory: {e}")
-                    # Fallback: use sudo
-                    try:
-                        subprocess.run(['sudo', 'rm', '-rf', str(seqs_dir)], 
-                                     capture_output=True, text=True, check=True)
-                        print_msg("32", "Removed seqs subdirectory with sudo")
-                    except subprocess.CalledProcessError as sudo_error:
-                        print_msg("31", f"Failed to remove seqs directory even with sudo: {sudo_error}")
+                # The container runs as the caller, so the files can simply be renamed
+                for fa_file in seqs_dir.glob("*.fa"):
+                    os.replace(fa_file, output_path / fa_file.name)
+                shutil.rmtree(seqs_dir)
             
             # List output files (now directly in the output directory)
             output_files = list(output_path.glob("*.fa"))
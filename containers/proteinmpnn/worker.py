@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Persistent ProteinMPNN worker for the benchmark container.
+
+Reads one JSON job per line from stdin ({"args": [...protein_mpnn_run.py args],
+"log": path}), runs protein_mpnn_run.py in this same process with its output
+written to the log file and answers each job with one JSON line
+({"returncode": ...}). Before the first job it announces itself with
+{"ready": true, "pid": ...}. torch, the CUDA context and the model checkpoints
+are loaded once and reused by every job.
+"""
+
+import contextlib
+import json
+import os
+import runpy
+import sys
+import traceback
+
+import torch
+
+MPNN_SCRIPT = '/app/protein_mpnn_run.py'
+
+_checkpoints = {}
+_torch_load = torch.load
+
+def _cached_load(f, *args, **kwargs):
+    """torch.load that reuses checkpoints already read from disk."""
+    if not isinstance(f, str):
+        return _torch_load(f, *args, **kwargs)
+    key = (f, str(kwargs.get('map_location')))
+    if key not in _checkpoints:
+        _checkpoints[key] = _torch_load(f, *args, **kwargs)
+    return _checkpoints[key]
+
+torch.load = _cached_load
+
+def run_job(argv, log_path):
+    """Run protein_mpnn_run.py with argv, logging to log_path; return its exit code."""
+    returncode = 0
+    sys.argv = [MPNN_SCRIPT] + [str(a) for a in argv]
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            runpy.run_path(MPNN_SCRIPT, run_name='__main__')
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                returncode = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+    return returncode
+
+def main():
+    # Keep the real stdout for the protocol and send anything else written to
+    # fd 1 (e.g. by native libraries) to stderr so it cannot corrupt a reply
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    protocol.write(json.dumps({'ready': True, 'pid': os.getpid()}) + '\n')
+    protocol.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        returncode = run_job(job['args'], job['log'])
+        protocol.write(json.dumps({'returncode': returncode}) + '\n')
+        protocol.flush()
+
+if __name__ == "__main__":
+    main()